@@ -2,14 +2,16 @@
 and expose lon/lat <-> XYZ tile conversion helpers."""
 
 import math
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import Dict, List, Optional, Tuple
 
 try:
+    import numpy as np
+    import pyproj
     import rasterio
-    from rasterio.warp import transform_bounds
 except ModuleNotFoundError as exc:  # pragma: no cover
-    raise SystemExit("rasterio is required to run this script") from exc
+    raise SystemExit("numpy, rasterio and pyproj are required to run this script") from exc
 
 # --- File path helper ------------------------------------------------------ #
 
@@ -39,7 +41,7 @@ def lonlat_to_tile_numbers(lon_deg: float, lat_deg: float, zoom: int) -> Tuple[f
     n = 2**zoom
     lat_rad = math.radians(lat_deg)
     xtile = n * ((lon_deg + 180.0) / 360.0)
-    ytile = n * (1 - (math.log(math.tan(lat_rad) + 1 / math.cos(lat_rad)) / math.pi)) / 2
+    ytile = n * (1 - (math.atanh(math.sin(lat_rad)) / math.pi)) / 2
     return xtile, ytile
 
 
@@ -57,6 +59,21 @@ def tile_numbers_to_lonlat(xtile: float, ytile: float, zoom: int) -> Tuple[float
 
 # --- GeoTIFF corner reader ------------------------------------------------- #
 
+# Points inserted along each bounds edge before reprojecting
+DENSIFY_PTS = 21
+
+
+@lru_cache(maxsize=64)
+def _cached_transformer(src_wkt: str) -> Optional[pyproj.Transformer]:
+    """
+    Build (once per source CRS) a transformer from `src_wkt` to WGS84, or
+    return None when `src_wkt` already is WGS84 and no reprojection is needed.
+    """
+
+    if pyproj.CRS.from_wkt(src_wkt).to_epsg() == 4326:
+        return None
+    return pyproj.Transformer.from_crs(src_wkt, "EPSG:4326", always_xy=True)
+
 
 def geotiff_corners_wgs84(dataset: rasterio.io.DatasetReader) -> Dict[str, Tuple[float, float]]:
     """
@@ -65,7 +82,79 @@ def geotiff_corners_wgs84(dataset: rasterio.io.DatasetReader) -> Dict[str, Tuple
     """
 
     left, bottom, right, top = dataset.bounds
-    lon_min, lat_min, lon_max, lat_max = transform_bounds(dataset.crs, "EPSG:4326", left, bottom, right, top, densify_pts=21)
+    transformer = _cached_transformer(dataset.crs.to_wkt())
+    if transformer is None:
+        lon_min, lat_min, lon_max, lat_max = left, bottom, right, top
+    else:
+        lon_min, lat_min, lon_max, lat_max = transformer.transform_bounds(left, bottom, right, top, densify_pts=DENSIFY_PTS)
+    return _corners_dict(lon_min, lat_min, lon_max, lat_max)
+
+
+def batch_corners_wgs84(datasets: List[rasterio.io.DatasetReader]) -> List[Dict[str, Tuple[float, float]]]:
+    """
+    Like `geotiff_corners_wgs84` for many datasets, in input order.
+
+    Datasets are grouped by CRS and each group is reprojected with a single
+    vectorized `transform` call over the densified edges of all its bounds.
+    """
+
+    groups: Dict[str, List[int]] = {}
+    for i, ds in enumerate(datasets):
+        groups.setdefault(ds.crs.to_wkt(), []).append(i)
+
+    corners: Dict[int, Dict[str, Tuple[float, float]]] = {}
+    for key, indices in groups.items():
+        transformer = _cached_transformer(key)
+        bounds = np.array([tuple(datasets[i].bounds) for i in indices], dtype=np.float64)
+        if transformer is not None:
+            bounds = _batch_transform_bounds(transformer, bounds)
+        for row, i in enumerate(indices):
+            corners[i] = _corners_dict(*(float(v) for v in bounds[row]))
+    return [corners[i] for i in range(len(datasets))]
+
+
+def _batch_transform_bounds(transformer: pyproj.Transformer, bounds: np.ndarray) -> np.ndarray:
+    """
+    Reproject (N, 4) rows of (left, bottom, right, top) to WGS84 bounds.
+
+    Rows whose edges cross the antimeridian, contain a pole or fail to
+    transform need `transform_bounds`' special handling and go through it.
+    """
+
+    t = np.linspace(0.0, 1.0, DENSIFY_PTS + 2)
+    left, bottom, right, top = (bounds[:, i : i + 1] for i in range(4))
+    along_x = left + (right - left) * t
+    along_y = bottom + (top - bottom) * t
+    ones = np.ones_like(t)
+
+    # (N, edge, point) with edges bottom, top, left, right
+    xs = np.stack((along_x, along_x, left * ones, right * ones), axis=1)
+    ys = np.stack((bottom * ones, top * ones, along_y, along_y), axis=1)
+    lons, lats = transformer.transform(xs.ravel(), ys.ravel())
+    lons = np.asarray(lons).reshape(xs.shape)
+    lats = np.asarray(lats).reshape(ys.shape)
+
+    result = np.stack(
+        (lons.min(axis=(1, 2)), lats.min(axis=(1, 2)), lons.max(axis=(1, 2)), lats.max(axis=(1, 2))),
+        axis=1,
+    )
+
+    # Consecutive points along an edge jumping by over 180 degrees of
+    # longitude means the edge wraps across the antimeridian
+    finite = np.isfinite(lons).all(axis=(1, 2)) & np.isfinite(lats).all(axis=(1, 2))
+    wraps = (np.abs(np.diff(lons, axis=2)) > 180.0).any(axis=(1, 2))
+
+    # Poles mapped back into the source CRS (inf when not representable)
+    pole_x, pole_y = transformer.transform([0.0, 0.0], [90.0, -90.0], direction="INVERSE")
+    pole_x, pole_y = np.asarray(pole_x), np.asarray(pole_y)
+    has_pole = ((left <= pole_x) & (pole_x <= right) & (bottom <= pole_y) & (pole_y <= top)).any(axis=1)
+
+    for row in np.flatnonzero(~finite | wraps | has_pole):
+        result[row] = transformer.transform_bounds(*bounds[row], densify_pts=DENSIFY_PTS)
+    return result
+
+
+def _corners_dict(lon_min: float, lat_min: float, lon_max: float, lat_max: float) -> Dict[str, Tuple[float, float]]:
     return {
         "top_left": (lat_max, lon_min),
         "top_right": (lat_max, lon_max),
@@ -90,14 +179,6 @@ def main():
         lat, lon = corners["top_left"]
         xtile, ytile = lonlat_to_tile_numbers(lon, lat, zoom=12)
 
-        int_x, int_y = int(xtile), int(ytile)
-        for i in range(10):
-            pass
-
-        
-
-
-
         lon_back, lat_back = tile_numbers_to_lonlat(xtile, ytile, zoom=12)
         print("\nExample conversion @ zoom 12:")
         print(f"  top_left -> tile numbers: xtile={xtile:.4f}, ytile={ytile:.4f}")
@@ -1,17 +1,81 @@
 import math
+import mmap
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import cv2
 import numpy as np
 
+try:
+    from numba import njit
+except ModuleNotFoundError:  # pragma: no cover - numba is optional
+
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
+
+@njit(cache=True, fastmath=True)
+def _latlon_to_tile_nb(lat, lon, zoom):
+    lat = max(min(lat, 85.05112878), -85.05112878)
+    lat_rad = math.radians(lat)
+    n = 2.0 ** zoom
+
+    # log(tan + 1/cos) == atanh(sin): two transcendentals instead of three
+    x = (lon + 180.0) / 360.0 * n
+    y = (0.5 - math.atanh(math.sin(lat_rad)) / (2.0 * math.pi)) * n
+
+    return x, y
+
 
 class TileMapRenderer:
     TILE_SIZE = 256
 
-    def __init__(self, tile_root: str):
+    # lod_reduce -> imdecode flag decoding at 1/2**lod_reduce resolution
+    _LOD_FLAGS = {
+        0: cv2.IMREAD_COLOR,
+        1: cv2.IMREAD_REDUCED_COLOR_2,
+        2: cv2.IMREAD_REDUCED_COLOR_4,
+        3: cv2.IMREAD_REDUCED_COLOR_8,
+    }
+
+    # Last 8 bytes of a tiles_<z>.bin pack, see pack()
+    _PACK_MAGIC = b"MGTPACK1"
+
+    def __init__(
+        self, tile_root: str, max_workers: int = 8, cache_size: int = 512
+    ):
         """
         tile_root: root directory of tiles (contains z/x/y.png)
+        max_workers: number of threads used to read and decode tiles
+        cache_size: number of decoded tiles kept in memory (~192 KiB each)
         """
         self.tile_root = tile_root
+        # cv2.imread releases the GIL while decoding, so threads scale
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+
+        self._cache = OrderedDict()
+        self._cache_cap = cache_size
+        self._cache_lock = threading.Lock()
+
+        # zoom -> (mmap, {(x, y): (offset, length)}) or None, see pack()
+        self._packs = {}
+        self._packs_lock = threading.Lock()
+
+    def close(self):
+        """
+        Shuts down the tile-reading thread pool.
+        """
+        self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
 
     # --------------------------------------------------
     # TILE MATH
@@ -19,17 +83,23 @@ class TileMapRenderer:
 
     @staticmethod
     def latlon_to_tile_fractional(lat, lon, zoom):
-        lat = max(min(lat, 85.05112878), -85.05112878)
-        n = 2 ** zoom
-
-        x = (lon + 180.0) / 360.0 * n
-        y = (
-            1.0
-            - math.log(
-                math.tan(math.radians(lat)) + 1.0 / math.cos(math.radians(lat))
-            )
-            / math.pi
-        ) / 2.0 * n
+        return _latlon_to_tile_nb(float(lat), float(lon), int(zoom))
+
+    @staticmethod
+    def latlon_to_tile_fractional_array(lats, lons, zoom):
+        """
+        Vectorized latlon_to_tile_fractional for arrays of coordinates.
+        Returns (x, y) as float64 arrays.
+        """
+        lats = np.clip(
+            np.asarray(lats, dtype=np.float64), -85.05112878, 85.05112878
+        )
+        lons = np.asarray(lons, dtype=np.float64)
+        n = 1 << zoom
+
+        lat_rad = np.radians(lats)
+        x = (lons + 180.0) / 360.0 * n
+        y = (0.5 - np.arctanh(np.sin(lat_rad)) / (2.0 * np.pi)) * n
 
         return x, y
 
@@ -40,98 +110,315 @@ class TileMapRenderer:
     def _tile_path(self, z, x, y):
         return os.path.join(self.tile_root, str(z), str(x), f"{y}.png")
 
-    def _load_tile(self, z, x, y):
-        path = self._tile_path(z, x, y)
-        if not os.path.exists(path):
+    def _pack_path(self, z):
+        return os.path.join(self.tile_root, f"tiles_{z}.bin")
+
+    def _open_pack(self, z):
+        with self._packs_lock:
+            if z in self._packs:
+                return self._packs[z]
+
+            try:
+                with open(self._pack_path(z), "rb") as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):  # missing or empty file
+                mm = None
+
+            pack = None
+            if mm is not None and len(mm) >= 16 and mm[-8:] == self._PACK_MAGIC:
+                # Trailer: int64 entry count, then the magic; the index
+                # (int64 rows of x, y, offset, length) sits right before it
+                count = int(np.frombuffer(mm, dtype=np.int64, count=1, offset=len(mm) - 16)[0])
+                index_off = len(mm) - 16 - count * 32
+                if count >= 0 and index_off >= 0:
+                    index = np.frombuffer(
+                        mm, dtype=np.int64, count=count * 4, offset=index_off
+                    ).reshape(-1, 4)
+                    pack = (
+                        mm,
+                        {(tx, ty): (off, size) for tx, ty, off, size in index.tolist()},
+                    )
+            self._packs[z] = pack
+            return pack
+
+    def _read_tile_bytes(self, z, x, y):
+        """
+        Returns the encoded tile as a uint8 array, from the zoom's pack if
+        one exists, otherwise with a single read of the PNG file.
+        """
+        pack = self._open_pack(z)
+        if pack is not None:
+            mm, index = pack
+            entry = index.get((x, y))
+            if entry is not None:
+                off, size = entry
+                return np.frombuffer(mm, dtype=np.uint8, count=size, offset=off)
+
+        try:
+            return np.fromfile(self._tile_path(z, x, y), dtype=np.uint8)
+        except OSError:
+            return None
+
+    def pack(self, zoom: int) -> int:
+        """
+        Packs every tile of a zoom level into a single tiles_<zoom>.bin
+        (tile data, then its index and a trailer), so the renderer serves
+        that zoom from one memory map. Returns tile count.
+        """
+        zoom_dir = os.path.join(self.tile_root, str(zoom))
+        pack_path = self._pack_path(zoom)
+
+        # Scan first so a missing zoom directory leaves no output behind
+        tiles = []
+        for x_entry in os.scandir(zoom_dir):
+            if not (x_entry.is_dir() and x_entry.name.isdigit()):
+                continue
+            for y_entry in os.scandir(x_entry.path):
+                stem, ext = os.path.splitext(y_entry.name)
+                if ext != ".png" or not stem.isdigit():
+                    continue
+                tiles.append((int(x_entry.name), int(stem), y_entry.path))
+
+        # Data and index live in one file published by a single os.replace:
+        # readers always see a matching pair, and existing mappings (here or
+        # in other processes) keep their old inode
+        rows = []
+        offset = 0
+        with open(pack_path + ".part", "wb") as out:
+            for tx, ty, path in tiles:
+                with open(path, "rb") as f:
+                    data = f.read()
+                out.write(data)
+                rows.append((tx, ty, offset, len(data)))
+                offset += len(data)
+
+            out.write(np.asarray(rows, dtype=np.int64).reshape(-1, 4).tobytes())
+            out.write(np.int64(len(rows)).tobytes())
+            out.write(self._PACK_MAGIC)
+
+        with self._packs_lock:
+            os.replace(pack_path + ".part", pack_path)
+            # The stale mapping is closed once in-flight reads release it
+            self._packs.pop(zoom, None)
+
+        return len(rows)
+
+    def _load_tile(self, z, x, y, lod_reduce=0, channel_order="BGR"):
+        key = (z, x, y, lod_reduce, channel_order)
+        with self._cache_lock:
+            img = self._cache.get(key)
+            if img is not None:
+                self._cache.move_to_end(key)
+                return img
+
+        buf = self._read_tile_bytes(z, x, y)
+        if buf is None or buf.size == 0:
             return None
-        img = cv2.imread(path, cv2.IMREAD_COLOR)
+        img = cv2.imdecode(buf, self._LOD_FLAGS[lod_reduce])
+        if img is not None and channel_order == "RGB":
+            # Swap once at load time, in place, so the output needs no pass
+            cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=img)
+
+        # Missing tiles are not cached, they may be downloaded later
+        if img is not None and self._cache_cap > 0:
+            with self._cache_lock:
+                self._cache[key] = img
+                self._cache.move_to_end(key)
+                while len(self._cache) > self._cache_cap:
+                    self._cache.popitem(last=False)
         return img
 
     # --------------------------------------------------
     # MAIN API
     # --------------------------------------------------
 
-    def render(
+    def plan(
         self,
-        center_lat: float,
-        center_lon: float,
+        center_lats,
+        center_lons,
         zoom: int,
         width: int,
         height: int,
-    ) -> np.ndarray:
+        lod_reduce: int = 0,
+    ):
         """
-        Returns a stitched image as a NumPy array (BGR, OpenCV format)
+        Computes tile bounds for a batch of frames centered on the given
+        coordinates, as int64 arrays:
+
+        tile_indices: (N, 4) -> tile_x_min, tile_y_min, tile_x_max, tile_y_max
+        dst_offsets:  (N, 2) -> output pixel position of the top-left tile
+
+        width and height are in reduced-resolution pixels (1/2**lod_reduce
+        of a full tile pixel), and so are dst_offsets.
         """
+        if lod_reduce not in self._LOD_FLAGS:
+            raise ValueError(
+                f"lod_reduce must be one of {sorted(self._LOD_FLAGS)}, "
+                f"got {lod_reduce!r}"
+            )
+        tile_size = self.TILE_SIZE >> lod_reduce
 
-        # Center position in global pixel space
-        tile_x, tile_y = self.latlon_to_tile_fractional(
-            center_lat, center_lon, zoom
+        # Center positions in global pixel space
+        tile_x, tile_y = self.latlon_to_tile_fractional_array(
+            np.atleast_1d(center_lats), np.atleast_1d(center_lons), zoom
         )
 
-        center_px_x = tile_x * self.TILE_SIZE
-        center_px_y = tile_y * self.TILE_SIZE
+        center_px_x = tile_x * tile_size
+        center_px_y = tile_y * tile_size
 
         half_w = width // 2
         half_h = height // 2
 
         # Global pixel bounds
-        min_px_x = int(center_px_x - half_w)
-        min_px_y = int(center_px_y - half_h)
+        min_px_x = (center_px_x - half_w).astype(np.int64)
+        min_px_y = (center_px_y - half_h).astype(np.int64)
         max_px_x = min_px_x + width
         max_px_y = min_px_y + height
 
         # Tile bounds
-        tile_x_min = min_px_x // self.TILE_SIZE
-        tile_y_min = min_px_y // self.TILE_SIZE
-        tile_x_max = (max_px_x - 1) // self.TILE_SIZE
-        tile_y_max = (max_px_y - 1) // self.TILE_SIZE
-
-        tiles_w = tile_x_max - tile_x_min + 1
-        tiles_h = tile_y_max - tile_y_min + 1
-
-        # Create a canvas large enough for all tiles
-        canvas = np.zeros(
-            (tiles_h * self.TILE_SIZE, tiles_w * self.TILE_SIZE, 3),
-            dtype=np.uint8,
-        )
+        tile_x_min = min_px_x // tile_size
+        tile_y_min = min_px_y // tile_size
+        tile_x_max = (max_px_x - 1) // tile_size
+        tile_y_max = (max_px_y - 1) // tile_size
 
-        # Load and place tiles
-        for tx in range(tile_x_min, tile_x_max + 1):
-            for ty in range(tile_y_min, tile_y_max + 1):
-                tile = self._load_tile(zoom, tx, ty)
-                if tile is None:
-                    continue
+        tile_indices = np.stack(
+            (tile_x_min, tile_y_min, tile_x_max, tile_y_max), axis=1
+        )
+        dst_offsets = np.stack(
+            (
+                tile_x_min * tile_size - min_px_x,
+                tile_y_min * tile_size - min_px_y,
+            ),
+            axis=1,
+        )
 
-                cx = (tx - tile_x_min) * self.TILE_SIZE
-                cy = (ty - tile_y_min) * self.TILE_SIZE
+        return tile_indices, dst_offsets
 
-                canvas[
-                    cy : cy + self.TILE_SIZE,
-                    cx : cx + self.TILE_SIZE,
-                ] = tile
+    def render(
+        self,
+        center_lat: float,
+        center_lon: float,
+        zoom: int,
+        width: int,
+        height: int,
+        lod_reduce: int = 0,
+        channel_order: str = "BGR",
+    ) -> np.ndarray:
+        """
+        Returns a stitched image as a NumPy array (BGR, OpenCV format,
+        unless channel_order="RGB")
 
-        # Crop to exact requested output
-        crop_x = min_px_x - tile_x_min * self.TILE_SIZE
-        crop_y = min_px_y - tile_y_min * self.TILE_SIZE
+        lod_reduce (0-3) decodes tiles at 1/2**lod_reduce resolution, so the
+        output spans 2**lod_reduce times the width and height on the ground.
+        """
+        tile_indices, dst_offsets = self.plan(
+            center_lat, center_lon, zoom, width, height, lod_reduce
+        )
+        return self._compose(
+            zoom,
+            width,
+            height,
+            tile_indices[0],
+            dst_offsets[0],
+            lod_reduce,
+            channel_order,
+        )
 
-        result = canvas[
-            crop_y : crop_y + height,
-            crop_x : crop_x + width,
+    def render_many(
+        self,
+        center_lats,
+        center_lons,
+        zoom: int,
+        width: int,
+        height: int,
+        lod_reduce: int = 0,
+        channel_order: str = "BGR",
+    ) -> list:
+        """
+        Renders one frame per center point, planning all of them at once.
+        Returns a list of images in channel_order.
+        """
+        tile_indices, dst_offsets = self.plan(
+            center_lats, center_lons, zoom, width, height, lod_reduce
+        )
+        return [
+            self._compose(
+                zoom,
+                width,
+                height,
+                tile_indices[i],
+                dst_offsets[i],
+                lod_reduce,
+                channel_order,
+            )
+            for i in range(len(tile_indices))
         ]
 
+    def _compose(
+        self,
+        zoom,
+        width,
+        height,
+        tile_indices,
+        dst_offsets,
+        lod_reduce=0,
+        channel_order="BGR",
+    ):
+        if channel_order not in ("BGR", "RGB"):
+            raise ValueError(
+                f"channel_order must be 'BGR' or 'RGB', got {channel_order!r}"
+            )
+        tile_size = self.TILE_SIZE >> lod_reduce
+        tile_x_min, tile_y_min, tile_x_max, tile_y_max = map(int, tile_indices)
+        off_x, off_y = map(int, dst_offsets)
+
+        # Tiles are clipped straight into the requested output size
+        result = np.empty((height, width, 3), dtype=np.uint8)
+
+        # Load tiles concurrently, place them as they complete
+        futures = {
+            self._pool.submit(
+                self._load_tile, zoom, tx, ty, lod_reduce, channel_order
+            ): (tx, ty)
+            for tx in range(tile_x_min, tile_x_max + 1)
+            for ty in range(tile_y_min, tile_y_max + 1)
+        }
+
+        for future in as_completed(futures):
+            tile = future.result()
+            tx, ty = futures[future]
+
+            # Tile origin relative to the output, then intersect
+            tile_px_x = off_x + (tx - tile_x_min) * tile_size
+            tile_px_y = off_y + (ty - tile_y_min) * tile_size
+
+            src_x0 = max(0, -tile_px_x)
+            src_y0 = max(0, -tile_px_y)
+            dst_x0 = max(0, tile_px_x)
+            dst_y0 = max(0, tile_px_y)
+            w = min(tile_size - src_x0, width - dst_x0)
+            h = min(tile_size - src_y0, height - dst_y0)
+
+            if tile is None:
+                result[dst_y0 : dst_y0 + h, dst_x0 : dst_x0 + w] = 0
+            else:
+                result[dst_y0 : dst_y0 + h, dst_x0 : dst_x0 + w] = tile[
+                    src_y0 : src_y0 + h,
+                    src_x0 : src_x0 + w,
+                ]
+
         return result
 
 
 
 if __name__ == "__main__":
-    renderer = TileMapRenderer(tile_root="tiles")
-
-    img = renderer.render(
-        center_lat=52.266862,
-        center_lon=20.750421,
-        zoom=17,
-        width=200,
-        height=200,
-    )
+    with TileMapRenderer(tile_root="tiles") as renderer:
+        img = renderer.render(
+            center_lat=52.266862,
+            center_lon=20.750421,
+            zoom=17,
+            width=200,
+            height=200,
+        )
 
     cv2.imwrite("output.png", img)
@@ -1,7 +1,36 @@
+import asyncio
 import math
 import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
+from urllib3.util.retry import Retry
+
+try:
+    from numba import njit, prange
+
+    HAVE_NUMBA = True
+except ModuleNotFoundError:  # pragma: no cover - numba is optional
+    HAVE_NUMBA = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
+try:
+    import aiofiles
+    import h2  # noqa: F401 - required by httpx for http2=True
+    import httpx
+
+    HAVE_HTTPX = True
+except ModuleNotFoundError:  # pragma: no cover - async download is optional
+    HAVE_HTTPX = False
 
 # ----------------------------
 # CONFIGURATION
@@ -24,61 +53,252 @@ HEADERS = {
 
 TIMEOUT = 10
 
+MAX_WORKERS = 8
+
+# Retry policy shared by the threaded and async downloaders
+RETRY_TOTAL = 5
+RETRY_BACKOFF = 0.5
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+# Async (httpx) downloader: requests in flight per batch
+ASYNC_BATCH = 64
+
+
+# ----------------------------
+# HTTP SESSION
+# ----------------------------
+
+# Shared across worker threads so TLS/keep-alive connections are reused.
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=16,
+        max_retries=Retry(
+            total=RETRY_TOTAL,
+            backoff_factor=RETRY_BACKOFF,
+            status_forcelist=RETRY_STATUSES,
+        ),
+    ),
+)
+
 
 # ----------------------------
 # TILE MATH (Web Mercator)
 # ----------------------------
 
-def latlon_to_tile(lat, lon, zoom):
+@njit(cache=True, fastmath=True)
+def _latlon_to_unit_nb(lat, lon):
+    """
+    Zoom-independent Web Mercator position in [0, 1); multiply by 2**zoom
+    to get fractional tile numbers.
+    """
     lat = max(min(lat, 85.05112878), -85.05112878)
-    n = 2 ** zoom
-
-    x = int((lon + 180.0) / 360.0 * n)
-    y = int(
-        (1.0 - math.log(math.tan(math.radians(lat)) + 1 / math.cos(math.radians(lat))) / math.pi)
-        / 2.0
-        * n
-    )
+    lat_rad = math.radians(lat)
+
+    x_part = (lon + 180.0) / 360.0
+    y_part = 0.5 - math.atanh(math.sin(lat_rad)) / (2.0 * math.pi)
+    return x_part, y_part
+
+
+@njit(cache=True, fastmath=True)
+def _latlon_to_tile_nb(lat, lon, zoom):
+    x_part, y_part = _latlon_to_unit_nb(lat, lon)
+    n = 2.0 ** zoom
+    return x_part * n, y_part * n
+
+
+@njit(cache=True, fastmath=True, parallel=True)
+def _latlon_to_unit_grid_nb(lats, lons):
+    xs = np.empty(lats.shape[0], dtype=np.float64)
+    ys = np.empty(lats.shape[0], dtype=np.float64)
+    for i in prange(lats.shape[0]):
+        xs[i], ys[i] = _latlon_to_unit_nb(lats[i], lons[i])
+    return xs, ys
+
+
+def latlon_to_tile(lat, lon, zoom):
+    x, y = _latlon_to_tile_nb(float(lat), float(lon), int(zoom))
+    return int(x), int(y)
+
+
+def latlon_to_unit_array(lat, lon):
+    """
+    Vectorized zoom-independent Web Mercator position in [0, 1) as float64
+    arrays. Scale by 2**zoom for tile numbers.
+    """
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -85.05112878, 85.05112878)
+    lon = np.asarray(lon, dtype=np.float64)
+
+    if HAVE_NUMBA:
+        lat, lon = np.broadcast_arrays(lat, lon)
+        x, y = _latlon_to_unit_grid_nb(lat.ravel(), lon.ravel())
+        return x.reshape(lat.shape), y.reshape(lat.shape)
+
+    lat_rad = np.radians(lat)
+    x = (lon + 180.0) / 360.0
+    y = 0.5 - np.arctanh(np.sin(lat_rad)) / (2.0 * np.pi)
     return x, y
 
 
+def latlon_to_tile_array(lat, lon, zoom):
+    """
+    Vectorized latlon_to_tile: accepts arrays (or scalars) of coordinates
+    and returns (x, y) tile indices as int64 arrays.
+    """
+    x, y = latlon_to_unit_array(lat, lon)
+    n = 1 << zoom
+    return (x * n).astype(np.int64), (y * n).astype(np.int64)
+
+
 # ----------------------------
 # DOWNLOAD LOGIC
 # ----------------------------
 
-def download_tile(z, x, y):
-    url = TILE_URL.format(z=z, x=x, y=y)
-    path = os.path.join(OUTPUT_DIR, str(z), str(x))
-    os.makedirs(path, exist_ok=True)
+def tile_dir(z, x):
+    return os.path.join(OUTPUT_DIR, str(z), str(x))
 
-    filename = os.path.join(path, f"{y}.png")
 
-    if os.path.exists(filename):
-        return
+def download_tile(session, z, x, y, path):
+    """
+    Fetch a single tile into `path`, its already existing z/x directory.
+    Tiles already on disk are filtered out beforehand by pending_tiles.
+    """
+    url = TILE_URL.format(z=z, x=x, y=y)
+    filename = os.path.join(path, f"{y}.png")
 
+    # Write to a temporary file so failures never leave half-written PNGs
+    partial = filename + ".part"
     try:
-        r = requests.get(url, headers=HEADERS, timeout=TIMEOUT)
-        r.raise_for_status()
-        with open(filename, "wb") as f:
-            f.write(r.content)
+        with session.get(url, stream=True, timeout=TIMEOUT) as r:
+            r.raise_for_status()
+            r.raw.decode_content = True
+            with open(partial, "wb") as f:
+                shutil.copyfileobj(r.raw, f, length=64 * 1024)
+        os.replace(partial, filename)
     except Exception as e:
         print(f"Failed: z={z} x={x} y={y} ({e})")
+        if os.path.exists(partial):
+            os.remove(partial)
 
 
-def download_bbox():
+def pending_tiles():
+    """
+    Yield (z, total, tiles) per zoom level, where `tiles` lists the
+    (z, x, y, path) tuples not yet on disk. Column directories are created
+    here so download workers never race on makedirs.
+    """
+    # Corner geometry does not depend on zoom, compute it once
+    x_parts, y_parts = latlon_to_unit_array([MIN_LAT, MAX_LAT], [MIN_LON, MAX_LON])
+
     for z in range(MIN_ZOOM, MAX_ZOOM + 1):
-        x_min, y_max = latlon_to_tile(MIN_LAT, MIN_LON, z)
-        x_max, y_min = latlon_to_tile(MAX_LAT, MAX_LON, z)
+        n = 1 << z
+        x_min, x_max = int(x_parts[0] * n), int(x_parts[1] * n)
+        y_max, y_min = int(y_parts[0] * n), int(y_parts[1] * n)
 
         total = (x_max - x_min + 1) * (y_max - y_min + 1)
+
+        # List each column once instead of stat-ing every tile
+        tiles = []
+        for x in range(x_min, x_max + 1):
+            path = tile_dir(z, x)
+            os.makedirs(path, exist_ok=True)
+            existing = {entry.name for entry in os.scandir(path)}
+            tiles.extend(
+                (z, x, y, path)
+                for y in range(y_min, y_max + 1)
+                if f"{y}.png" not in existing
+            )
+
+        yield z, total, tiles
+
+
+def download_bbox():
+    for z, total, tiles in pending_tiles():
         print(f"Zoom {z}: {total} tiles")
 
-        with tqdm(total=total) as pbar:
-            for x in range(x_min, x_max + 1):
-                for y in range(y_min, y_max + 1):
-                    download_tile(z, x, y)
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = [
+                executor.submit(download_tile, SESSION, *tile) for tile in tiles
+            ]
+            with tqdm(total=total, initial=total - len(tiles)) as pbar:
+                for _ in as_completed(futures):
                     pbar.update(1)
 
 
+# ----------------------------
+# ASYNC DOWNLOAD LOGIC (httpx, HTTP/2)
+# ----------------------------
+
+async def _get_with_retry(client, url):
+    """
+    client.get with the same retry/backoff policy as SESSION's Retry:
+    transport errors and RETRY_STATUSES are retried up to RETRY_TOTAL times,
+    sleeping RETRY_BACKOFF * 2**attempt (or Retry-After, when given).
+    """
+    for attempt in range(RETRY_TOTAL + 1):
+        last = attempt == RETRY_TOTAL
+        try:
+            r = await client.get(url)
+        except httpx.TransportError:
+            if last:
+                raise
+            await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+            continue
+
+        if r.status_code not in RETRY_STATUSES or last:
+            return r
+
+        retry_after = r.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            delay = float(retry_after)
+        else:
+            delay = RETRY_BACKOFF * 2 ** attempt
+        await asyncio.sleep(delay)
+
+
+async def download_tile_async(client, z, x, y, path):
+    """
+    Async counterpart of download_tile; many of these share one HTTP/2
+    connection through `client`.
+    """
+    url = TILE_URL.format(z=z, x=x, y=y)
+    filename = os.path.join(path, f"{y}.png")
+
+    partial = filename + ".part"
+    try:
+        r = await _get_with_retry(client, url)
+        r.raise_for_status()
+        async with aiofiles.open(partial, "wb") as f:
+            await f.write(r.content)
+        os.replace(partial, filename)
+    except Exception as e:
+        print(f"Failed: z={z} x={x} y={y} ({e})")
+        if os.path.exists(partial):
+            os.remove(partial)
+
+
+async def download_bbox_async():
+    limits = httpx.Limits(max_keepalive_connections=16, max_connections=32)
+    async with httpx.AsyncClient(
+        http2=True, headers=HEADERS, timeout=TIMEOUT, limits=limits
+    ) as client:
+        for z, total, tiles in pending_tiles():
+            print(f"Zoom {z}: {total} tiles")
+
+            with tqdm(total=total, initial=total - len(tiles)) as pbar:
+                for i in range(0, len(tiles), ASYNC_BATCH):
+                    batch = tiles[i : i + ASYNC_BATCH]
+                    await asyncio.gather(
+                        *(download_tile_async(client, *tile) for tile in batch)
+                    )
+                    pbar.update(len(batch))
+
+
 if __name__ == "__main__":
-    download_bbox()
+    if HAVE_HTTPX:
+        asyncio.run(download_bbox_async())
+    else:
+        download_bbox()